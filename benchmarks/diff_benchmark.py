@@ -0,0 +1,89 @@
+"""Times the timber list diff on two 100k row lists.
+
+Run from the repository root with plain Python, Fusion is not needed:
+    python benchmarks/diff_benchmark.py
+
+The diff modules only use the standard library, so they are imported straight from the command folder.
+Exits with 1 when the best run of the in-memory diffs, or of the add-in's own case of a previous export against
+the live list, is over TARGET seconds."""
+
+import csv
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'commands'))
+
+from parseToCSV.diff import diffTimberListFiles, diffTimberLists, loadTimberList  # noqa: E402
+from parseToCSV.fields import FIELDNAMES  # noqa: E402
+
+
+ROWS = 100000
+TARGET = 1.0
+
+
+def timberList(rows, seed):
+    '''A list shaped like a real export: exact sizes in arch notation, quantities as the CSV stores them.'''
+    rng = random.Random(seed)
+    lines = []
+    for i in range(rows):
+        qty = rng.randint(1, 6)
+        lines.append([f'Timber {i}', f'LCTF-{i}', 'Oak, White', str(qty), '16', '8', '6', str(40.0 * qty),
+                      'placeholder', f'{rng.randint(60, 200)} 3/8', '8', '6 1/2', '55.2', '8x8', '16', '12.5',
+                      '0', '', str(qty)])
+    return lines
+
+
+def revise(lines, seed):
+    '''Next revision: 1% of members resized, 1% change qty, 0.5% removed and 0.5% added.'''
+    rng = random.Random(seed)
+    revised = [list(line) for line in lines]
+    for line in rng.sample(revised, len(revised) // 100):
+        line[9] = f'{rng.randint(60, 200)} 1/8'
+    for line in rng.sample(revised, len(revised) // 100):
+        line[3] = str(int(line[3]) + 1)
+    del revised[:len(revised) // 200]
+    revised += timberList(len(lines) // 200, seed + 1)
+    for i, line in enumerate(revised[-(len(lines) // 200):]):
+        line[1] = f'LCTF-NEW-{i}'
+    return revised
+
+
+def writeList(filename, lines):
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Length field is rounded up to the nearest even, and 2' is added for ordering purposes."])
+        writer.writerow(FIELDNAMES)
+        writer.writerows(lines)
+
+
+def best(function):
+    return min(timeit.repeat(function, number=1, repeat=5))
+
+
+def main():
+    old = timberList(ROWS, 1)
+    new = revise(old, 2)
+    results = {}
+    for key in ('part', 'geometry'):
+        results[f'in memory, {key} key'] = best(lambda: diffTimberLists(old, new, key))
+
+    with tempfile.TemporaryDirectory() as folder:
+        old_file, new_file = os.path.join(folder, 'old.csv'), os.path.join(folder, 'new.csv')
+        writeList(old_file, old)
+        writeList(new_file, new)
+        results['previous file vs live'] = best(lambda: diffTimberLists(loadTimberList(old_file), new))
+        both_files = best(lambda: diffTimberListFiles(old_file, new_file))
+
+    changes = len(diffTimberLists(old, new))
+    print(f'{ROWS} rows, {changes} changes')
+    for name, seconds in results.items():
+        print(f'{name:24} {seconds:.3f} s')
+    print(f'{"two files, part key":24} {both_files:.3f} s (not held to TARGET, mostly reading both CSVs)')
+    return 0 if max(results.values()) < TARGET else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import csv
+from collections import namedtuple
+from operator import itemgetter
+
+from .fields import FIELDNAMES
+
+
+DIFF_FIELDNAMES = ['Change', 'Key', 'Name', 'Material', 'Old Qty', 'New Qty', 'Old Size - in', 'New Size - in',
+                   'Boardfeet Delta', 'Mass Delta - lbs']
+
+# One member of a timber list reduced to what the diff reports. Quantity, board feet and mass are totals for
+# every row that shares the key.
+TimberRecord = namedtuple('TimberRecord', ['name', 'material', 'qty', 'size', 'boardFeet', 'mass'])
+
+# Columns a member is keyed on. Exact sizes are written longest side first, so the geometry key can use the
+# text as it is without parsing it.
+KEY_COLUMNS = {
+        'part': (1,),
+        'name': (0,),
+        'geometry': (2, 9, 10, 11)
+    }
+
+# Material, exact size and qty as written, the fast check for an unchanged member.
+_UNCHANGED = itemgetter(2, 9, 10, 11, 3)
+
+# Rows need at least the columns up to the exact mass, so lists exported before the stock columns still load.
+ROW_WIDTH = FIELDNAMES.index('Exact Mass - lbs') + 1
+
+
+def loadTimberList(filename):
+    '''Reads a Timber List CSV export back into rows, without the note line above the header.'''
+    with open(filename, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        for row in reader:
+            if row[:2] == FIELDNAMES[:2]:
+                return list(reader)
+    raise ValueError(f'{filename} is not a Timber List CSV, no header row was found.')
+
+
+def indexTimberRows(rows, key='part'):
+    '''Hashes timber list rows into {key: [rows]} in a single pass. key is 'part' for the part number,
+    'name' for the component name, or 'geometry' for a fingerprint of material and exact dimensions, which
+    still lines members up when a revision renumbers or renames them. Nothing is converted here, numbers are
+    only parsed for the members that turn out to have changed.'''
+    if key not in KEY_COLUMNS:
+        raise ValueError(f'Unknown diff key "{key}". Use part, name or geometry.')
+    rows = [row for row in rows if len(row) >= ROW_WIDTH]
+    keyOf = itemgetter(*KEY_COLUMNS[key])
+    index = {keyOf(row): [row] for row in rows}
+    if len(index) < len(rows):  # some keys span several rows, the last one won above
+        index = {}
+        for row in rows:
+            index.setdefault(keyOf(row), []).append(row)
+    return index
+
+
+def _summary(rows):
+    '''What decides whether a member changed: material, exact size and total qty.'''
+    first = rows[0]
+    if len(rows) == 1:
+        return first[2], first[9], first[10], first[11], int(first[3])
+    return first[2], first[9], first[10], first[11], sum(int(row[3]) for row in rows)
+
+
+def _record(rows):
+    first = rows[0]
+    qty = sum(int(row[3]) for row in rows)
+    return TimberRecord(first[0], first[2], qty, ' x '.join(first[9:12]), sum(float(row[7]) for row in rows),
+                        sum(float(row[12]) * int(row[3]) for row in rows))
+
+
+def diffTimberLists(old_rows, new_rows, key='part'):
+    '''Compares two timber lists and returns one list per changed member, laid out as DIFF_FIELDNAMES.
+    Unchanged members are left out. Both lists are hashed once, so this is linear in the number of rows.'''
+    old = indexTimberRows(old_rows, key)
+    new = indexTimberRows(new_rows, key)
+
+    changes = []
+    for record_key, after in new.items():
+        before = old.get(record_key)
+        if before is None:
+            changes.append(_change('Added', record_key, None, _record(after)))
+            continue
+        if len(before) == 1 and len(after) == 1 and _UNCHANGED(before[0]) == _UNCHANGED(after[0]):
+            continue
+        old_summary, new_summary = _summary(before), _summary(after)
+        if old_summary == new_summary:  # the same qty written as an int and as text
+            continue
+        status = []
+        if old_summary[1:4] != new_summary[1:4]:
+            status.append('Resized')
+        if old_summary[4] != new_summary[4]:
+            status.append('Qty Changed')
+        if old_summary[0] != new_summary[0]:
+            status.append('Material Changed')
+        changes.append(_change(', '.join(status), record_key, _record(before), _record(after)))
+    for record_key, before in old.items():
+        if record_key not in new:
+            changes.append(_change('Removed', record_key, _record(before), None))
+    return changes
+
+
+def _change(status, record_key, before, after):
+    current = after or before
+    if type(record_key) is tuple:
+        record_key = current.size
+    return [status, record_key, current.name, current.material,
+            before.qty if before else 0, after.qty if after else 0,
+            before.size if before else '', after.size if after else '',
+            round((after.boardFeet if after else 0) - (before.boardFeet if before else 0), 1),
+            round((after.mass if after else 0) - (before.mass if before else 0), 1)]
+
+
+def diffTimberListFiles(old_filename, new_filename, key='part'):
+    '''Diff between two exported Timber List CSVs.'''
+    return diffTimberLists(loadTimberList(old_filename), loadTimberList(new_filename), key)
+
+
+def writeTimberDiff(filename, changes):
+    '''Writes the changes from diffTimberLists with a totals line for purchasing.'''
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(DIFF_FIELDNAMES)
+        writer.writerows(changes)
+        writer.writerow(['Total', '', '', '', '', '', '', '',
+                         round(sum(change[8] for change in changes), 1),
+                         round(sum(change[9] for change in changes), 1)])
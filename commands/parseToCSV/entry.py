@@ -7,6 +7,13 @@ import traceback
 import csv
 from fractions import Fraction
 import math
+from .query import OccurrenceIndex
+from .fields import FIELDNAMES
+from .diff import loadTimberList, diffTimberLists, writeTimberDiff
+from .stock import loadStockCatalog, stockWaste
+from .inventory import loadInventory
+from .fingerprint import groupTimbers
+from .snapshot import SnapshotRecord, normalizeFrame, writeSnapshot
 
 app = adsk.core.Application.get()
 ui = app.userInterface
@@ -36,6 +43,11 @@ ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource
 # they are not released and garbage collected.
 local_handlers = []
 
+# Index of the design's occurrences used by the query input. Built on the first query typed into the dialog,
+# shared by the match count preview and the run, and dropped when the command is destroyed so the next run
+# sees the current design.
+occurrence_index = None
+
 wood_species = {
         'Model': [True, 1.0],
         'Ash, Black': [False, 0.833],
@@ -99,6 +111,14 @@ wood_species = {
         'Willow': [False, 0.865]
     }
 
+# Diff key for each entry of the compare dropdown, None leaves the comparison off.
+diff_keys = {
+        'Off': None,
+        'Part #': 'part',
+        'Name': 'name',
+        'Geometry': 'geometry'
+    }
+
 # Executed when add-in is run.
 def start():
     # Create a command Definition.
@@ -155,9 +175,14 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     # Add first user entry
     selectionInput = inputs.addSelectionInput(CMD_ID + '_selection', 'Timbers',
                                               'Select timbers to add to CSV Timber List')  # returns object(s) from selection
-    selectionInput.setSelectionLimits(1)  # set limit to >= 1
+    selectionInput.setSelectionLimits(0)  # a query can stand in for the selection, checked in validate inputs
     selectionInput.addSelectionFilter(adsk.core.SelectionCommandInput.Occurrences)  #  Basically limit selection to components
 
+    # Optional query, matched occurrences are added to the selection
+    queryInput = inputs.addTextBoxCommandInput(CMD_ID + '_query', 'Query', '', 1, False)
+    queryInput.tooltip = 'Select timbers by filter, e.g. name=BR-*; material=Oak, White; path=Bent 3; attr=group.name=value'
+    inputs.addTextBoxCommandInput(CMD_ID + '_queryMatches', 'Matches', '', 1, True)
+
     # Add second user entry
     inputs.addTextBoxCommandInput(CMD_ID + '_partPrefix', 'Part Number Prefix', "LCTF-", 1, False)
 
@@ -168,6 +193,25 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     for name, status in wood_species.items():
         dropdownItems.add(name, status[0])
 
+    # Add fourth user entry, compares the new list against a previous export
+    diffInput = inputs.addDropDownCommandInput(CMD_ID + '_diffKey', 'Compare to Previous By',
+                                               adsk.core.DropDownStyles.TextListDropDownStyle)
+    for name in diff_keys:
+        diffInput.listItems.add(name, name == 'Off')
+    diffInput.tooltip = 'Writes a -diff.csv of added, removed, resized and quantity changed members against a previous Timber List CSV'
+
+    # Add stock entry, snaps members to sizes a mill sells
+    stockInput = inputs.addBoolValueInput(CMD_ID + '_stock', 'Snap to Stock Catalog', True, '', False)
+    stockInput.tooltip = 'Choose a stock catalog CSV of species, sections and lengths. stock_catalog.csv in the add-in folder is an example to copy.'
+
+    # Add fifth user entry, fills members from the yard before ordering
+    inventoryInput = inputs.addBoolValueInput(CMD_ID + '_inventory', 'Match Yard Inventory', True, '', False)
+    inventoryInput.tooltip = 'Choose an inventory CSV of on-hand pieces. Members that fit a piece are taken from the yard instead of bought.'
+
+    # Add sixth user entry, binary geometry for downstream tools
+    snapshotInput = inputs.addBoolValueInput(CMD_ID + '_snapshot', 'Export Snapshot', True, '', False)
+    snapshotInput.tooltip = 'Also writes a .tls binary snapshot of each timber box frame, transform and dimensions next to the CSV. Re-exports only append changed occurrences.'
+
 
     # TODO Connect to the events that are needed by this command.
     futil.add_handler(args.command.execute, command_execute, local_handlers=local_handlers)
@@ -189,6 +233,11 @@ def command_execute(args: adsk.core.CommandEventArgs):
     selection: adsk.core.SelectionCommandInput = inputs.itemById(CMD_ID + '_selection')
     partPrefix: adsk.core.TextBoxCommandInput = inputs.itemById(CMD_ID + '_partPrefix')
     speciesData: adsk.core.DropDownCommandInput = inputs.itemById(CMD_ID + '_species')
+    queryText: adsk.core.TextBoxCommandInput = inputs.itemById(CMD_ID + '_query')
+    diffKey: adsk.core.DropDownCommandInput = inputs.itemById(CMD_ID + '_diffKey')
+    matchInventory: adsk.core.BoolValueCommandInput = inputs.itemById(CMD_ID + '_inventory')
+    snapToStock: adsk.core.BoolValueCommandInput = inputs.itemById(CMD_ID + '_stock')
+    exportSnapshot: adsk.core.BoolValueCommandInput = inputs.itemById(CMD_ID + '_snapshot')
 
 
     # TODO ******************************** Your code here ********************************
@@ -197,23 +246,95 @@ def command_execute(args: adsk.core.CommandEventArgs):
     futil.log(f'Inputs: {inputs}')
 
     objects = getSelectedObjects(selection)  #  Calls separate function to validate and return components from selection.
+    try:
+        queried = getQueriedObjects(queryText.text)
+    except ValueError as error:
+        ui.messageBox(str(error))
+        return
+    if not objects and not queried:
+        ui.messageBox('No timbers matched the query.')
+        return
+
+    # a query counts only the occurrences it matched, a clicked timber counts every copy beside it
+    clicked, matched_occurrences = {}, {}
+    for obj in objects:
+        clicked.setdefault(obj.component.entityToken, []).append(obj)
+    for obj in queried:
+        matched_occurrences.setdefault(obj.component.entityToken, []).append(obj)
+    objects += queried
     obj_properties = {}  # create a dictionary to hold all the properties
     part_index = 1  # start the part index at 1
 
-    # uses dictionary to eliminate duplicate occurrences in the output and obtain count
-    for obj in objects:
-        qty = obj.sourceComponent.allOccurrencesByComponent(obj.component).count
+    # Without a catalog the stock columns are left empty
+    stock_catalog = None
+    if snapToStock.value:
+        fileDialog = ui.createFileDialog()
+        fileDialog.isMultiSelectEnabled = False
+        fileDialog.title = "Stock Catalog"
+        fileDialog.filter = 'CSV (*.csv)'
+        fileDialog.filterIndex = 0
+        if fileDialog.showOpen() != adsk.core.DialogResults.DialogOK:
+            return
+        try:
+            stock_catalog = loadStockCatalog(fileDialog.filename)
+        except (OSError, ValueError) as error:
+            ui.messageBox(f'The stock catalog could not be read.\n{error}')
+            return
+
+    # groups identically shaped timbers on one line before any bounding boxes are measured
+    groups, collisions = groupTimbers(objects, lambda obj: TimberData(obj).getMaterial(speciesData),
+                                      lambda obj: countedPlacements(obj, clicked, matched_occurrences))
+    if collisions:
+        names = ', '.join(f'{name} ({count} shapes)' for name, count in collisions.items())
+        futil.log(f'Components sharing a name but not a shape: {names}', force_console=True)
+        ui.messageBox(f'These component names are used by differently shaped timbers and are listed separately:\n{names}')
+
+    for group in groups:
+        obj = group.occurrence
+        name = ' / '.join(group.names)
+        if group.components > 1:
+            futil.log(f'Merged {group.components} components with matching geometry onto one line: {name}',
+                      force_console=True)
+        if name in obj_properties:  # a name collision, keep both lines
+            copy = 2
+            while f'{name} ({copy})' in obj_properties:
+                copy += 1
+            name = f'{name} ({copy})'
 
         # Dictionary contains the following: component name, list of bounding box properties, qty of occurrences, mass, material
-        obj_properties[obj.component.name] = [TimberData(obj).timberProperties(),
-                                                qty, TimberData(obj).getMass(speciesData),
-                                                TimberData(obj).getMaterial(speciesData)]
+        obj_properties[name] = [TimberData(obj).timberProperties(),
+                                group.qty, TimberData(obj).getMass(speciesData),
+                                group.material]
+        snapStock(stock_catalog, obj_properties[name])
+        obj_properties[name][0]["occurrences"] = group.occurrences
+        obj_properties[name][0]["frameComponent"] = obj.component.entityToken
 
     for key in obj_properties.keys():  # Create part numbers iterating over dictionary to avoid duplicates
         part_number = str(partPrefix.text) + str(part_index)
         obj_properties[key].append(part_number)
         part_index += 1
 
+    # Takes what it can from the yard, everything else is bought
+    matched = {}
+    if matchInventory.value:
+        fileDialog = ui.createFileDialog()
+        fileDialog.isMultiSelectEnabled = False
+        fileDialog.title = "Yard Inventory"
+        fileDialog.filter = 'CSV (*.csv)'
+        fileDialog.filterIndex = 0
+        if fileDialog.showOpen() != adsk.core.DialogResults.DialogOK:
+            return
+        try:
+            inventory = loadInventory(fileDialog.filename)
+        except (OSError, ValueError) as error:
+            ui.messageBox(f'The yard inventory could not be read.\n{error}')
+            return
+        # remnants are matched on exact length, inventory.TRIM_ALLOWANCE is added for squaring the ends
+        matched = inventory.match([(key, obj[3], obj[0]["exact"][1], obj[0]["exact"][2], obj[0]["exact"][0], obj[1])
+                                   for key, obj in obj_properties.items()])
+    for key, obj in obj_properties.items():
+        obj[0]["inventory"] = matched.get(key, [])
+
 
     # Do something interesting
     fileDialog = ui.createFileDialog()
@@ -228,18 +349,40 @@ def command_execute(args: adsk.core.CommandEventArgs):
         return
 
     # Writes CSV with all the collected fields
+    rows = timberRows(obj_properties)
     with open(filename, 'w', newline='') as csvfile:
-        fieldnames = ['Name', 'Part #', 'Material', 'Qty', 'Order Length - ft', 'Order Width - in', 'Order Height - in',
-                      "Total Boardfeet", "Order Mass - kg", "Exact Length - in", "Exact Width - in", "Exact Height - in",
-                      'Exact Mass - lbs']
         writer = csv.writer(csvfile)
         writer.writerow(["Length field is rounded up to the nearest even, and 2' is added for ordering purposes."])
-        writer.writerow(fieldnames)
-        for name, obj in obj_properties.items():
-            row = [name, obj[4], obj[3], obj[1], obj[0]['length'], obj[0]['width'], obj[0]['height'],
-                   str(float(obj[0]["boardFeet"])*float(obj[1])), "placeholder", obj[0]["r_length"], obj[0]["r_width"],
-                   obj[0]["r_height"], obj[2]]  # weight
-            writer.writerow(row)
+        writer.writerow(FIELDNAMES)
+        writer.writerows(rows)
+
+    # Numeric geometry for CNC prep and estimating, appended to the snapshot beside the CSV
+    if exportSnapshot.value:
+        snapshot = os.path.splitext(filename)[0] + '.tls'
+        try:
+            appended = writeSnapshot(snapshot, snapshotRecords(obj_properties))
+        except (OSError, ValueError) as error:
+            ui.messageBox(f'The Timber List was saved, but the snapshot could not be written.\n{error}')
+            return
+        futil.log(f'{appended} changed occurrences and the current labels appended to {snapshot}')
+
+    # Compares against the previous revision of the list if asked to
+    key = diff_keys[diffKey.selectedItem.name]
+    if key:
+        fileDialog = ui.createFileDialog()
+        fileDialog.isMultiSelectEnabled = False
+        fileDialog.title = "Previous Timber List"
+        fileDialog.filter = 'CSV (*.csv)'
+        fileDialog.filterIndex = 0
+        if fileDialog.showOpen() != adsk.core.DialogResults.DialogOK:
+            return
+        try:
+            changes = diffTimberLists(loadTimberList(fileDialog.filename), rows, key)
+        except ValueError as error:
+            ui.messageBox(f'The Timber List was saved, but it could not be compared.\n{error}')
+            return
+        writeTimberDiff(os.path.splitext(filename)[0] + '-diff.csv', changes)
+        futil.log(f'{len(changes)} members changed since {fileDialog.filename}')
 
 # This event handler is called when the command needs to compute a new preview in the graphics window.
 def command_preview(args: adsk.core.CommandEventArgs):
@@ -259,6 +402,15 @@ def command_input_changed(args: adsk.core.InputChangedEventArgs):
     dropdownInput: adsk.core.DropDownCommandInput = inputs.itemById(CMD_ID + '_species')
     futil.log(f'Selected: {dropdownInput.selectedItem.name}')
 
+    # Previews how many timbers the query matches, which builds the index the run will reuse
+    if changed_input.id == CMD_ID + '_query':
+        matchesText: adsk.core.TextBoxCommandInput = inputs.itemById(CMD_ID + '_queryMatches')
+        try:
+            query = adsk.core.TextBoxCommandInput.cast(changed_input).text
+            matchesText.text = f'{len(getQueriedObjects(query))} timbers'
+        except ValueError as error:
+            matchesText.text = str(error)
+
 
 # This event handler is called when the user interacts with any of the inputs in the dialog
 # which allows you to verify that all of the inputs are valid and enables the OK button.
@@ -267,8 +419,11 @@ def command_validate_input(args: adsk.core.ValidateInputsEventArgs):
     futil.log(f'{CMD_NAME} Validate Input Event')
 
     inputs = args.inputs
+    selection: adsk.core.SelectionCommandInput = inputs.itemById(CMD_ID + '_selection')
+    queryText: adsk.core.TextBoxCommandInput = inputs.itemById(CMD_ID + '_query')
 
-    args.areInputsValid = True
+    # Either a selection or a query has to supply the timbers.
+    args.areInputsValid = selection.selectionCount > 0 or bool(queryText.text.strip())
 
     # Verify the validity of the input values. This controls if the OK button is enabled or not.
     #valueInput = inputs.itemById('value_input')
@@ -283,8 +438,9 @@ def command_destroy(args: adsk.core.CommandEventArgs):
     # General logging for debug.
     futil.log(f'{CMD_NAME} Command Destroy Event')
 
-    global local_handlers
+    global local_handlers, occurrence_index
     local_handlers = []
+    occurrence_index = None
 
 ### MY CODE
 
@@ -300,6 +456,90 @@ def getSelectedObjects(selectionInput):
     return objects
 
 
+def getQueriedObjects(query_text):
+    '''Returns the occurrences matched by the query input. The occurrence index is built once per command, so
+    the preview of every edit to the query and the final run only pay for the lookups.'''
+    global occurrence_index
+    if not query_text.strip():
+        return []
+    if occurrence_index is None:
+        design = adsk.fusion.Design.cast(app.activeProduct)
+        occurrence_index = OccurrenceIndex(design.rootComponent)
+    return occurrence_index.query(query_text)
+
+
+def timberRows(obj_properties):
+    '''Lays the collected properties out as Timber List CSV rows, in FIELDNAMES order.'''
+    rows = []
+    for name, obj in obj_properties.items():
+        to_buy = obj[1] - len(obj[0]["inventory"])
+        stock = [obj[0]["stock"], obj[0]["stockLength"], obj[0]["stockWaste"]] if to_buy else ["", "", ""]  # all from the yard
+        rows.append([name, obj[4], obj[3], obj[1], obj[0]['length'], obj[0]['width'], obj[0]['height'],
+                     str(float(obj[0]["boardFeet"])*float(obj[1])), "placeholder", obj[0]["r_length"], obj[0]["r_width"],
+                     obj[0]["r_height"], obj[2]] +  # weight
+                    stock +
+                    [len(obj[0]["inventory"]), ' '.join(obj[0]["inventory"]), to_buy,
+                     str(float(obj[0]["boardFeet"])*float(to_buy))])
+    return rows
+
+
+def snapshotRecords(obj_properties):
+    '''One record per occurrence counted on each line, for writeSnapshot. The line's box frame is shared by the
+    occurrences of its measured component. A component merged onto the line by its fingerprint has its own
+    origin, so its box is measured once here, still once per component rather than per occurrence.'''
+    records = []
+    for name, obj in obj_properties.items():
+        props = obj[0]
+        frames = {props["frameComponent"]: props["frame"]}
+        for occurrence in props["occurrences"]:
+            token = occurrence.component.entityToken
+            if token not in frames:
+                frames[token] = TimberData(occurrence).componentFrame()
+            dims, center, axes = frames[token]
+            records.append(SnapshotRecord(occurrence.fullPathName, name, obj[4], obj[3], dims, center, axes,
+                                          tuple(occurrence.transform2.asArray())))
+    return records
+
+
+def snapStock(stock_catalog, obj):
+    '''Adds the smallest catalog stock that contains the timber, and how much of it is wasted, to its properties.
+    The stock length has to cover the order length so the trim allowance is kept. With no catalog the stock
+    fields are left empty.'''
+    props = obj[0]
+    length, width, height = props["exact"]
+    snapped = stock_catalog.snap(obj[3], width, height, props["length"]) if stock_catalog else None
+    if snapped is None:
+        props["stock"] = "Special order" if stock_catalog else ""
+        props["stockLength"], props["stockWaste"] = "", ""
+    else:
+        stock, stock_length = snapped
+        props["stock"], props["stockLength"] = stock.nominal, dec_to_proper_frac(stock_length)
+        props["stockWaste"] = stockWaste(stock, stock_length, width, height, length)
+
+
+def getPlacements(obj):
+    '''Every occurrence of the clicked timber's component under the same parent occurrence, the copies the
+    line's qty counts.'''
+    occurrences = obj.component.parentDesign.rootComponent.allOccurrencesByComponent(obj.component)
+    if obj.assemblyContext is None:
+        return list(occurrences)
+    parent_path = obj.assemblyContext.fullPathName + '+'
+    return [occ for occ in occurrences if occ.fullPathName.startswith(parent_path)]
+
+
+def countedPlacements(obj, clicked, matched_occurrences):
+    '''Occurrences of obj's component a line counts: every copy beside each clicked occurrence of it plus every
+    occurrence the query matched, each counted once even when it was both clicked and matched.'''
+    token = obj.component.entityToken
+    counted = {}
+    for clicked_obj in clicked.get(token, []):
+        for occ in getPlacements(clicked_obj):
+            counted.setdefault(occ.fullPathName, occ)
+    for occ in matched_occurrences.get(token, []):
+        counted.setdefault(occ.fullPathName, occ)
+    return list(counted.values())
+
+
 def dec_to_proper_frac(dec):
     '''Float to arch notation for ordering.'''
     sign = "-" if dec < 0 else ""
@@ -345,11 +585,32 @@ class TimberData:
             rounded_length = roundEven(length) + 2  # rounds to nearest 2 and then adds 2'
             board_feet = rounded_length*(dim_sorted[1]/2.54)*((dim_sorted[2]/2.54)/12)
             sel_prop["Occurrence"] = self.fusionObject.name
+            sel_prop["exact"] = [dim / 2.54 for dim in dim_sorted]  # unrounded length, width, height in inches
+            sel_prop["frame"] = self.componentFrame(min_box)  # raw box for the snapshot
             sel_prop["length"], sel_prop["width"], sel_prop["height"], sel_prop["boardFeet"], sel_prop["r_length"], \
                 sel_prop["r_width"], sel_prop["r_height"] = \
                 rounded_length, width, height, round(board_feet), real_length, real_width, real_height
         return sel_prop
 
+    def componentFrame(self, min_box=None):
+        '''Dimensions (raw cm), center and axes of the minimum bounding box in the component's own coordinates, so
+        the same frame holds for every occurrence of the component once its transform is applied. Normalised so the
+        solver returning the box with its sides in another order or its axes flipped reads as the same frame.'''
+        min_box = min_box or self.fusionObject.orientedMinimumBoundingBox
+        to_component = adsk.core.Matrix3D.create()
+        if type(self.fusionObject) is adsk.fusion.Occurrence:
+            to_component = self.fusionObject.transform2.copy()
+            to_component.invert()
+        center = min_box.centerPoint.copy()
+        center.transformBy(to_component)
+        axes = ()
+        for direction in (min_box.lengthDirection, min_box.widthDirection, min_box.heightDirection):
+            direction = direction.copy()
+            direction.transformBy(to_component)
+            axes += tuple(direction.asArray())
+        dims, axes = normalizeFrame((min_box.length, min_box.width, min_box.height), axes)
+        return dims, tuple(center.asArray()), axes
+
     def getMass(self, species_data):
         '''Requires command dropdown input from 'Command Created' function. If the default 'Model' parameter
         is selected, it uses the default mass from fusion, applied individually to each timber. This is set by
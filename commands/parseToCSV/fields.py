@@ -0,0 +1,6 @@
+# Columns of the Timber List CSV, in the order they are written. timberRows in entry.py lays the rows out to
+# match, and the diff reads exports back by these positions.
+FIELDNAMES = ['Name', 'Part #', 'Material', 'Qty', 'Order Length - ft', 'Order Width - in', 'Order Height - in',
+              "Total Boardfeet", "Order Mass - kg", "Exact Length - in", "Exact Width - in", "Exact Height - in",
+              'Exact Mass - lbs', 'Stock', 'Stock Length - ft', 'Stock Waste %',
+              'From Inventory', 'Inventory Pieces', 'To Buy', 'To Buy Boardfeet']
@@ -0,0 +1,121 @@
+import math
+from collections import namedtuple
+
+
+# Copies of a member measure the same to far better than this relative difference, while members that really
+# differ are off by much more. Measures are compared with it rather than rounded, so two copies can never fall
+# on opposite sides of a rounding boundary.
+TOLERANCE = 1e-6
+
+# Width of the volume buckets, cm^3. A member is only compared with the groups in its own bucket and the two
+# next to it, so copies just across a bucket edge are still found without comparing against every group.
+VOLUME_BUCKET = 1.0
+
+# Fingerprint of a member. shape must match exactly: material, face/edge/vertex counts and handedness.
+# measures are compared with TOLERANCE: volume, surface area and the sorted principal radii of gyration.
+Fingerprint = namedtuple('Fingerprint', ['shape', 'measures'])
+
+# Members with the same fingerprint are listed on one line. names are the component names merged into it in
+# the order they were found, occurrences are every placement counted on the line and qty is how many there are.
+# components is how many distinct components were merged onto the line.
+TimberGroup = namedtuple('TimberGroup', ['fingerprint', 'occurrence', 'material', 'qty', 'names', 'occurrences',
+                                         'components'])
+
+
+def _handedness(occurrence, properties, moments):
+    '''Tells a part from its mirror image, 1 or -1, or 0 for parts that are their own mirror image.
+
+    The vertices are projected onto the principal axes, ordered by moment, and the skew (sum of cubed
+    projections) along each axis is taken. Flipping an axis negates both its skew and the determinant of the
+    axes, so skew1 * skew2 * skew3 * det does not depend on which way the axes happen to point, but a mirror
+    flips the determinant alone and so flips its sign.'''
+    principal = properties.getPrincipalAxes()
+    if not principal[0]:
+        return 0
+    axes = [axis for _, axis in sorted(zip(moments, principal[1:]), key=lambda pair: pair[0])]
+    center = properties.centerOfMass
+    points = [(vertex.geometry.x - center.x, vertex.geometry.y - center.y, vertex.geometry.z - center.z)
+              for body in occurrence.bRepBodies for vertex in body.vertices]
+
+    sign = 1 if axes[0].crossProduct(axes[1]).dotProduct(axes[2]) > 0 else -1
+    for axis in axes:
+        projections = [x * axis.x + y * axis.y + z * axis.z for x, y, z in points]
+        skew = sum(projection ** 3 for projection in projections)
+        if abs(skew) <= TOLERANCE * sum(abs(projection) ** 3 for projection in projections):
+            return 0  # symmetric along this axis, so the part is its own mirror image
+        sign *= 1 if skew > 0 else -1
+    return sign
+
+
+def geometryFingerprint(occurrence, material):
+    '''Orientation independent fingerprint of an occurrence built only from cheap properties: material, volume,
+    surface area, face/edge/vertex counts, handedness and the sorted principal radii of gyration, which stand in
+    for the principal extents without computing a bounding box. Radii are used rather than raw moments of
+    inertia so the fingerprint does not depend on the density of the material assigned in the model.'''
+    properties = occurrence.physicalProperties
+    faces = edges = vertices = 0
+    for body in occurrence.bRepBodies:
+        faces += body.faces.count
+        edges += body.edges.count
+        vertices += body.vertices.count
+
+    radii, handedness = (0.0, 0.0, 0.0), 0
+    moments = properties.getPrincipalMomentsOfInertia()
+    if moments[0] and properties.mass > 0:
+        radii = tuple(sorted(math.sqrt(max(moment, 0.0) / properties.mass) for moment in moments[1:]))
+        handedness = _handedness(occurrence, properties, moments[1:])
+
+    return Fingerprint((material, faces, edges, vertices, handedness),
+                       (properties.volume, properties.area) + radii)
+
+
+def _sameMeasures(a, b):
+    return all(math.isclose(x, y, rel_tol=TOLERANCE, abs_tol=TOLERANCE) for x, y in zip(a, b))
+
+
+def groupTimbers(occurrences, getMaterial, getPlacements):
+    '''Groups occurrences into one TimberGroup per distinct geometry. Each component is fingerprinted once, so
+    copy-pasted components that are shaped alike end up on the same line and only the first occurrence of a
+    group needs its bounding box measured. getMaterial(occurrence) returns the material name used for the line,
+    getPlacements(occurrence) the occurrences of its component that count towards the line's qty.
+
+    Returns (groups, collisions), where collisions maps every component name shared by differently shaped
+    components to the number of distinct shapes using it.'''
+    seen = set()  # component tokens, so repeated occurrences are not fingerprinted again
+    groups = []
+    buckets = {}  # (shape, volume bucket) -> indexes into groups
+    shapes_by_name = {}
+    for occurrence in occurrences:
+        component = occurrence.component
+        if component.entityToken in seen:
+            continue
+        seen.add(component.entityToken)
+        material = getMaterial(occurrence)
+        fingerprint = geometryFingerprint(occurrence, material)
+        bucket = round(fingerprint.measures[0] / VOLUME_BUCKET)
+
+        match = None
+        for neighbour in (bucket, bucket - 1, bucket + 1):
+            for i in buckets.get((fingerprint.shape, neighbour), []):
+                if _sameMeasures(groups[i].fingerprint.measures, fingerprint.measures):
+                    match = i
+                    break
+            if match is not None:
+                break
+
+        placements = getPlacements(occurrence)
+        if match is None:
+            match = len(groups)
+            groups.append(TimberGroup(fingerprint, occurrence, material, len(placements), [component.name],
+                                      list(placements), 1))
+            buckets.setdefault((fingerprint.shape, bucket), []).append(match)
+        else:
+            group = groups[match]
+            if component.name not in group.names:
+                group.names.append(component.name)
+            group.occurrences.extend(placements)
+            groups[match] = group._replace(qty=len(group.occurrences), components=group.components + 1)
+        shapes_by_name.setdefault(component.name, set()).add(match)
+
+    collisions = {name: len(shapes) for name, shapes in shapes_by_name.items() if len(shapes) > 1}
+    return groups, collisions
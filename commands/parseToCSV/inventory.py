@@ -0,0 +1,103 @@
+import bisect
+import csv
+from collections import namedtuple
+
+from .stock import TOLERANCE
+
+
+# Columns of an inventory CSV, one on-hand piece per row. Sizes are actual inches.
+INVENTORY_FIELDNAMES = ['Id', 'Species', 'Width - in', 'Height - in', 'Length - in']
+
+# Extra length, inches, a remnant needs beyond a member's exact length to square and trim both ends. Remnants are
+# cut to length in the shop, so they don't take the 2 ft ordering allowance the mill order carries.
+TRIM_ALLOWANCE = 2.0
+
+# One piece of timber in the yard. width >= height.
+InventoryPiece = namedtuple('InventoryPiece', ['id', 'species', 'width', 'height', 'length'])
+
+
+class Inventory:
+
+    """On-hand remnants indexed for matching against a timber list. Pieces are grouped by species and
+    cross-section, the sections of a species are sorted by their smaller then larger side, and the pieces of a
+    section are kept sorted by length. A member is matched by bisecting to the sections that contain it and
+    then to the shortest piece long enough in each, and takes whichever leaves the least offcut."""
+
+    def __init__(self, pieces):
+        sections = {}
+        for piece in pieces:
+            sections.setdefault(piece.species, {}).setdefault((piece.height, piece.width), []).append(piece)
+
+        self.sections = {}  # species -> sorted [(height, width)]
+        self.lengths = {}  # (species, height, width) -> sorted lengths
+        self.pieces = {}  # (species, height, width) -> pieces in the same order as lengths
+        for species, species_sections in sections.items():
+            self.sections[species] = sorted(species_sections)
+            for (height, width), section_pieces in species_sections.items():
+                section_pieces.sort(key=lambda piece: piece.length)
+                self.pieces[(species, height, width)] = section_pieces
+                self.lengths[(species, height, width)] = [piece.length for piece in section_pieces]
+
+    def take(self, species, width, height, length):
+        '''Removes and returns the best fitting piece for a member, exact sizes in inches, or None when none is big
+        enough. The piece has to be TRIM_ALLOWANCE longer than the member.'''
+        width, height = max(width, height) - TOLERANCE, min(width, height) - TOLERANCE
+        length += TRIM_ALLOWANCE - TOLERANCE
+        member_volume = width * height * length
+        sections = self.sections.get(species, [])
+
+        best, best_waste = None, None
+        for i in range(bisect.bisect_left(sections, (height,)), len(sections)):
+            section_height, section_width = sections[i]
+            if best_waste is not None and section_height * width * length - member_volume >= best_waste:
+                break  # every section from here on is at least this tall, so none can waste less
+            if section_width < width:
+                continue
+            key = (species, section_height, section_width)
+            lengths = self.lengths[key]
+            j = bisect.bisect_left(lengths, length)
+            if j == len(lengths):
+                continue
+            waste = section_height * section_width * lengths[j] - member_volume
+            if best_waste is None or waste < best_waste:
+                best, best_waste = (key, j), waste
+
+        if best is None:
+            return None
+        key, j = best
+        del self.lengths[key][j]
+        return self.pieces[key].pop(j)
+
+    def match(self, members):
+        '''Assigns pieces to members. members is a list of (key, species, width, height, exact length, qty) and the
+        result maps each key to the ids of the pieces it takes. Biggest members are matched first so they get
+        first pick of the big remnants, and every piece is used at most once.'''
+        matched = {}
+        for key, species, width, height, length, qty in sorted(members, key=lambda member: member[2] * member[3] * member[4],
+                                                              reverse=True):
+            ids = matched.setdefault(key, [])
+            for _ in range(qty):
+                piece = self.take(species, width, height, length)
+                if piece is None:
+                    break
+                ids.append(piece.id)
+        return matched
+
+
+def loadInventory(filename):
+    '''Reads the yard inventory CSV, columns as INVENTORY_FIELDNAMES. Raises ValueError naming the line when the
+    file does not fit that layout.'''
+    pieces = []
+    with open(filename, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        missing = [column for column in INVENTORY_FIELDNAMES if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f'{filename} is missing the column(s) {", ".join(missing)}.')
+        for row in reader:
+            try:
+                width, height, length = float(row['Width - in']), float(row['Height - in']), float(row['Length - in'])
+            except (TypeError, ValueError):
+                raise ValueError(f'{filename} line {reader.line_num} has a size that is not a number.')
+            pieces.append(InventoryPiece((row['Id'] or '').strip(), (row['Species'] or '').strip(),
+                                         max(width, height), min(width, height), length))
+    return Inventory(pieces)
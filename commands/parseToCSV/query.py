@@ -0,0 +1,107 @@
+import bisect
+
+
+class OccurrenceIndex:
+
+    """One-time index over every timber occurrence in a design so the Timber List can be driven by a query
+    instead of a click selection. Occurrences are indexed by component name (sorted, for prefix lookups),
+    material, attribute and parent path. Each filter resolves through a dictionary or bisect lookup, and the
+    filters of a query are intersected smallest first, so nothing walks the whole assembly after the build.
+
+    Query syntax is a list of clauses separated by ';', each written as key=value:
+        name=BR-*                 component name starts with 'BR-' (without '*' the name must match exactly)
+        material=Oak, White       component material
+        path=Bent 3               anywhere under a subassembly whose component is named 'Bent 3'
+        path=Frame/Bent 3         under the exact parent path 'Frame/Bent 3' (or any deeper path)
+        attr=group.name           has the attribute, attr=group.name=value to also match its value"""
+
+    def __init__(self, rootComponent):
+        self.occurrences = []  # position in this list is the id used by every other index
+        self.names = []  # sorted (component name, id) pairs for bisect prefix lookups
+        self.byName = {}
+        self.byMaterial = {}
+        self.byAttribute = {}
+        self.byParent = {}
+        self.byPath = {}
+
+        for occ in rootComponent.allOccurrences:
+            if occ.component.bRepBodies.count == 0:  # assemblies only group timbers, they are not timbers
+                continue
+            self.add(occ)
+        self.names.sort()
+
+    def add(self, occ):
+        '''Registers a single occurrence under every index it belongs to.'''
+        occ_id = len(self.occurrences)
+        self.occurrences.append(occ)
+
+        name = occ.component.name
+        self.names.append((name, occ_id))
+        self.byName.setdefault(name, []).append(occ_id)
+
+        material = occ.component.material
+        if material:
+            self.byMaterial.setdefault(material.name, []).append(occ_id)
+
+        for attribute in occ.attributes:
+            self.byAttribute.setdefault((attribute.groupName, attribute.name), []).append(occ_id)
+            self.byAttribute.setdefault((attribute.groupName, attribute.name, attribute.value), []).append(occ_id)
+
+        parents = []
+        context = occ.assemblyContext
+        while context:
+            parents.insert(0, context.component.name)
+            context = context.assemblyContext
+        for depth, parent in enumerate(parents):
+            self.byParent.setdefault(parent, []).append(occ_id)
+            self.byPath.setdefault('/'.join(parents[:depth + 1]), []).append(occ_id)
+
+    def nameStartsWith(self, prefix):
+        '''Ids of all occurrences whose component name starts with prefix, found by bisecting the sorted names.'''
+        start = bisect.bisect_left(self.names, (prefix,))
+        stop = bisect.bisect_left(self.names, (prefix + '\U0010ffff',), start)
+        return [occ_id for _, occ_id in self.names[start:stop]]
+
+    def lookup(self, key, value):
+        '''Resolves a single query clause to a list of occurrence ids.'''
+        key = key.strip().lower()
+        value = value.strip()
+        if key == 'name':
+            if value.endswith('*'):
+                return self.nameStartsWith(value[:-1])
+            return self.byName.get(value, [])
+        if key == 'material':
+            return self.byMaterial.get(value, [])
+        if key == 'path':
+            value = '/'.join(part.strip() for part in value.strip('/').split('/'))
+            if '/' in value:
+                return self.byPath.get(value, [])
+            return self.byParent.get(value, [])
+        if key == 'attr':
+            parts = value.split('=', 1)
+            group, _, name = parts[0].strip().partition('.')
+            if len(parts) == 2:
+                return self.byAttribute.get((group, name, parts[1].strip()), [])
+            return self.byAttribute.get((group, name), [])
+        raise ValueError(f'Unknown query filter "{key}". Use name, material, path or attr.')
+
+    def query(self, text):
+        '''Returns the occurrences matching every clause of the query text, in assembly order.'''
+        clauses = [clause for clause in text.split(';') if clause.strip()]
+        if not clauses:
+            return []
+
+        matches = []
+        for clause in clauses:
+            key, sep, value = clause.partition('=')
+            if not sep:
+                raise ValueError(f'Query filter "{clause.strip()}" must be written as key=value.')
+            matches.append(self.lookup(key, value))
+
+        matches.sort(key=len)  # intersect from the smallest candidate set down
+        ids = set(matches[0])
+        for match in matches[1:]:
+            if not ids:
+                break
+            ids.intersection_update(match)
+        return [self.occurrences[occ_id] for occ_id in sorted(ids)]
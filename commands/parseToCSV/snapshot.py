@@ -0,0 +1,190 @@
+"""Binary snapshot of a timber list for downstream tools.
+
+A snapshot is three append-only files written next to the CSV. None needs parsing, all can be memory mapped.
+Each starts with a 16 byte header, an 8 byte magic then the record size and header size as little-endian uint32.
+
+<name>.tls, the geometry. Magic b'TLSNAP02', then fixed size records of 272 bytes, one per placed occurrence:
+
+    offset  type        field
+    0       uint32      revision, starts at 1 and goes up by one each export
+    4       uint32      flags, 1 when the occurrence was removed from the list in this revision
+    8       uint32 x 4  offset and length in the string file of the key and material
+    24      float64 x 3 raw box length, width, height in cm, longest first
+    48      float64 x 3 box center, cm, in the component's own coordinates
+    72      float64 x 9 box length, width and height directions, unit vectors in the component's coordinates
+    144     float64 x 16 occurrence transform, row major 4x4, from component to world coordinates
+    272
+
+The key is the occurrence's full path in the assembly, e.g. 'Bent 3:1+Post:2', and stays the same from one export
+to the next. Every occurrence of a line shares its box, so the world frame of a record is its transform applied to
+the box center and directions. Each direction is flipped so its largest component is positive, so the same box
+always comes out the same way round.
+
+<name>.tls.labels, the line name and part number of every occurrence. Magic b'TLSLBL01', then 28 byte records:
+
+    offset  type        field
+    0       uint32      revision
+    4       uint32 x 6  offset and length in the string file of the key, line name and part number
+    28
+
+Line names and part numbers follow the order of the list, so every export appends a full set of labels under its
+revision. The labels with the highest revision are the current ones, the part numbers of the CSV beside them.
+
+<name>.tls.strings, the string table. The magic b'TLSTRS01' followed by UTF-8 text, offsets are from the start
+of the file. Strings already in the table are reused rather than appended again.
+
+The equivalent NumPy dtypes are
+    numpy.dtype([('revision', '<u4'), ('flags', '<u4'), ('strings', '<u4', (4,)),
+                 ('dims', '<f8', (3,)), ('center', '<f8', (3,)), ('axes', '<f8', (3, 3)), ('transform', '<f8', (4, 4))])
+    numpy.dtype([('revision', '<u4'), ('strings', '<u4', (6,))])
+so numpy.memmap(name + '.tls', dtype, mode='r', offset=16) reads every record in place.
+
+A geometry record is appended only when the occurrence is new, was removed, or its material, box or transform
+moved by more than TOLERANCE. The last geometry record for a key is the current state of that occurrence."""
+
+import math
+import os
+import struct
+from collections import namedtuple
+
+
+RECORD_MAGIC = b'TLSNAP02'
+LABEL_MAGIC = b'TLSLBL01'
+STRINGS_MAGIC = b'TLSTRS01'
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<II4I3d3d9d16d')
+LABEL = struct.Struct('<I6I')
+REMOVED = 1
+
+# The bounding box solver and the transforms are floating point, so a re-export of an untouched occurrence can
+# differ in the last bits. Numbers closer than this (cm, or unitless for directions) count as unchanged.
+TOLERANCE = 1e-6
+
+# One occurrence as written to the snapshot. dims, center, axes and transform are flat tuples of floats.
+SnapshotRecord = namedtuple('SnapshotRecord', ['key', 'name', 'part', 'material', 'dims', 'center', 'axes',
+                                               'transform'])
+
+_EMPTY = SnapshotRecord('', '', '', '', (0.0,) * 3, (0.0,) * 3, (0.0,) * 9, (0.0,) * 16)
+
+
+def normalizeFrame(dims, axes):
+    '''Orders a box's dims longest first with their directions, and flips each direction so its largest component
+    is positive. axes is the flat 9 tuple of the length, width and height directions.'''
+    pairs = sorted(zip(dims, (axes[0:3], axes[3:6], axes[6:9])), key=lambda pair: -pair[0])
+    normalized = ()
+    for _, axis in pairs:
+        if max(axis, key=abs) < 0:
+            axis = tuple(-value for value in axis)
+        normalized += tuple(axis)
+    return tuple(dim for dim, _ in pairs), normalized
+
+
+def _close(a, b):
+    return all(math.isclose(x, y, rel_tol=TOLERANCE, abs_tol=TOLERANCE) for x, y in zip(a, b))
+
+
+def _changed(previous, record):
+    '''Whether a record's geometry or material moved from the previous one for its key. Labels are kept in the
+    labels file, so they are not compared here.'''
+    return previous.material != record.material or not (
+        _close(previous.dims, record.dims) and _close(previous.center, record.center) and
+        _close(previous.axes, record.axes) and _close(previous.transform, record.transform))
+
+
+def _read(filename, magic, record, what):
+    '''Records of one snapshot file as tuples, after checking its header and that it holds whole records.'''
+    with open(filename, 'rb') as snapshot_file:
+        data = snapshot_file.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f'{filename} is too short to be a Timber List {what}.')
+    file_magic, record_size, header_size = HEADER.unpack_from(data)
+    if file_magic != magic or record_size != record.size:
+        raise ValueError(f'{filename} is not a Timber List {what} this version can read.')
+    if (len(data) - header_size) % record.size:
+        raise ValueError(f'{filename} ends in a partial record, it was probably cut off while being written. '
+                         f'Export to a new snapshot.')
+    return record.iter_unpack(data[header_size:])
+
+
+def readSnapshot(filename):
+    '''Returns (revision, {key: (flags, SnapshotRecord)}, spans). Each record is the latest geometry for its key
+    with the latest labels, spans maps every string in the table to its (offset, length).'''
+    if not os.path.exists(filename):
+        return 0, {}, {}
+    for suffix in ('.labels', '.strings'):
+        if not os.path.exists(filename + suffix):
+            raise ValueError(f'{filename} has no {os.path.basename(filename)}{suffix} file beside it.')
+    with open(filename + '.strings', 'rb') as strings_file:
+        strings = strings_file.read()
+
+    decoded = {}
+
+    def text(offset, length):
+        if (offset, length) not in decoded:
+            decoded[(offset, length)] = strings[offset:offset + length].decode('utf-8')
+        return decoded[(offset, length)]
+
+    revision, latest = 0, {}
+    for values in _read(filename, RECORD_MAGIC, RECORD, 'snapshot'):
+        revision = max(revision, values[0])
+        latest[text(*values[2:4])] = (values[1], SnapshotRecord(text(*values[2:4]), '', '', text(*values[4:6]),
+                                                                values[6:9], values[9:12], values[12:21],
+                                                                values[21:37]))
+
+    labels, label_revision = {}, 0
+    for values in _read(filename + '.labels', LABEL_MAGIC, LABEL, 'snapshot label file'):
+        if values[0] > label_revision:
+            labels, label_revision = {}, values[0]
+        labels[text(*values[1:3])] = (text(*values[3:5]), text(*values[5:7]))
+    revision = max(revision, label_revision)
+
+    for key, (flags, record) in latest.items():
+        if key in labels:
+            latest[key] = (flags, record._replace(name=labels[key][0], part=labels[key][1]))
+    return revision, latest, {value: span for span, value in decoded.items()}
+
+
+def writeSnapshot(filename, records):
+    '''Appends the records whose geometry changed, plus removals, and the labels of every record under a new
+    revision. Returns how many geometry records were appended. A new snapshot is created when the file does not
+    exist yet.'''
+    revision, latest, spans = readSnapshot(filename)
+    revision += 1
+
+    changed = []
+    for record in records:
+        previous = latest.pop(record.key, None)
+        if previous is None or previous[0] == REMOVED or _changed(previous[1], record):
+            changed.append((0, record))
+    for key, (flags, record) in latest.items():  # occurrences no longer in the list
+        if flags != REMOVED:
+            changed.append((REMOVED, _EMPTY._replace(key=key)))
+
+    if not os.path.exists(filename):
+        for suffix, magic, record in (('', RECORD_MAGIC, RECORD), ('.labels', LABEL_MAGIC, LABEL)):
+            with open(filename + suffix, 'wb') as snapshot_file:
+                snapshot_file.write(HEADER.pack(magic, record.size, HEADER.size))
+        with open(filename + '.strings', 'wb') as strings_file:
+            strings_file.write(STRINGS_MAGIC)
+
+    with open(filename + '.strings', 'ab') as strings_file:
+        strings_file.seek(0, os.SEEK_END)
+
+        def span(text):
+            if text not in spans:
+                encoded = text.encode('utf-8')
+                spans[text] = (strings_file.tell(), len(encoded))
+                strings_file.write(encoded)
+            return spans[text]
+
+        packed = [RECORD.pack(revision, flags, *span(record.key), *span(record.material), *record.dims,
+                              *record.center, *record.axes, *record.transform)
+                  for flags, record in changed]
+        labels = [LABEL.pack(revision, *span(record.key), *span(record.name), *span(record.part))
+                  for record in records]
+
+    with open(filename, 'ab') as records_file:
+        records_file.write(b''.join(packed))
+    with open(filename + '.labels', 'ab') as labels_file:
+        labels_file.write(b''.join(labels))
+    return len(packed)
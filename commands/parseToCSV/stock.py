@@ -0,0 +1,104 @@
+import bisect
+import csv
+import os
+from collections import namedtuple
+
+
+# Example catalog shipped with the add-in. Copy it somewhere outside the add-in folder before editing, an update of
+# the add-in replaces this file.
+STOCK_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stock_catalog.csv')
+
+# Columns of a stock catalog CSV.
+CATALOG_FIELDNAMES = ['Species', 'Nominal', 'Width - in', 'Height - in', 'Lengths - ft']
+
+# Species column value for stock that any species can be ordered in.
+ANY_SPECIES = '*'
+
+# Measured sizes come back from the model with float noise, so a 6" member must still fit 6" stock.
+TOLERANCE = 1 / 64
+
+# One orderable cross-section. width >= height, both actual inches, lengths are sorted feet.
+StockItem = namedtuple('StockItem', ['nominal', 'width', 'height', 'lengths'])
+
+
+class StockIndex:
+
+    """Cross-sections available for one species, grouped by their smaller side. Heights are kept sorted, and
+    within a height the widths are sorted, so finding the smallest section that contains a member is a pair of
+    bisects per height rather than a scan of the whole catalog."""
+
+    def __init__(self, items):
+        groups = {}
+        for item in items:
+            groups.setdefault(item.height, []).append(item)
+        self.heights = sorted(groups)
+        self.items = [sorted(groups[height], key=lambda item: item.width) for height in self.heights]
+        self.widths = [[item.width for item in group] for group in self.items]
+
+    def smallest(self, width, height, length):
+        '''Smallest section by area that contains a width x height member and comes in at least length feet.
+        Returns (StockItem, stock length) or None when nothing in the catalog is big enough.'''
+        best, best_area = None, None
+        for i in range(bisect.bisect_left(self.heights, height), len(self.heights)):
+            if best_area is not None and self.heights[i] * width >= best_area:
+                break  # every section from here on is at least this tall, so none can be smaller
+            group = self.items[i]
+            for j in range(bisect.bisect_left(self.widths[i], width), len(group)):
+                item = group[j]
+                if item.lengths[-1] >= length:
+                    area = item.width * item.height
+                    if best_area is None or area < best_area:
+                        best, best_area = item, area
+                    break
+        if best is None:
+            return None
+        return best, best.lengths[bisect.bisect_left(best.lengths, length)]
+
+
+class StockCatalog:
+
+    """Stock catalog split into one StockIndex per species. Species without entries of their own, and the
+    materials read from the model, fall back to the stock listed under '*'."""
+
+    def __init__(self, items):
+        '''items is an iterable of (species, StockItem).'''
+        by_species = {}
+        for species, item in items:
+            by_species.setdefault(species, []).append(item)
+        common = by_species.get(ANY_SPECIES, [])
+        self.indexes = {species: StockIndex(species_items + common if species != ANY_SPECIES else species_items)
+                        for species, species_items in by_species.items()}
+        self.common = self.indexes.get(ANY_SPECIES, StockIndex([]))
+
+    def snap(self, species, width, height, length):
+        '''Snaps a member (inches, inches, feet) to the smallest stock of its species that contains it.'''
+        width, height = max(width, height) - TOLERANCE, min(width, height) - TOLERANCE
+        return self.indexes.get(species, self.common).smallest(width, height, length)
+
+
+def loadStockCatalog(filename=STOCK_CATALOG):
+    '''Reads a stock catalog CSV with the columns Species, Nominal, Width - in, Height - in, Lengths - ft.
+    Lengths are separated by spaces. Raises ValueError naming the line when the file does not fit that layout.'''
+    items = []
+    with open(filename, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        missing = [column for column in CATALOG_FIELDNAMES if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f'{filename} is missing the column(s) {", ".join(missing)}.')
+        for row in reader:
+            try:
+                width, height = float(row['Width - in']), float(row['Height - in'])
+                lengths = sorted(float(length) for length in row['Lengths - ft'].split())
+            except (TypeError, ValueError):
+                raise ValueError(f'{filename} line {reader.line_num} has a size that is not a number.')
+            if not lengths:
+                continue
+            items.append(((row['Species'] or '').strip(),
+                          StockItem((row['Nominal'] or '').strip(), max(width, height), min(width, height), lengths)))
+    return StockCatalog(items)
+
+
+def stockWaste(stock, stock_length, width, height, length):
+    '''Percent of the stock volume that does not end up in the member. Member dims in inches, stock length in feet.'''
+    stock_volume = stock.width * stock.height * stock_length * 12
+    return round((1 - (width * height * length) / stock_volume) * 100, 1)